@@ -0,0 +1,381 @@
+"""API HTTP/JSON lokal untuk kasir tanpa Streamlit.
+
+Memakai fungsi dan database yang sama dengan sawi.py sehingga scanner,
+kiosk self-checkout dan skrip integrasi tidak perlu lewat UI. Satu proses
+melayani banyak terminal sekaligus.
+
+    python api.py --host 127.0.0.1 --port 8502
+
+Endpoint:
+    GET  /produk?q=sawi&tersedia=1&ids=1,2   katalog (pencarian / lookup banyak id)
+    GET  /produk/<id>                        detail satu produk
+    POST /produk/stok                        {"perubahan": [{"produk_id": 1, "stok": 10}, ...]}
+    POST /nota                               alokasikan nomor nota berikutnya
+    POST /checkout                           {"kasir": "sinda", "metode_bayar": "Tunai",
+                                              "items": [{"produk_id": 1, "qty": 2}, ...],
+                                              "nota": "CS/..."}  (opsional, dari POST /nota)
+    POST /checkout/batch                     {"transaksi": [<isi /checkout>, ...]}
+    GET  /laporan?dari=YYYY-MM-DD&sampai=YYYY-MM-DD
+"""
+import argparse
+import asyncio
+import json
+import re
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from urllib.parse import parse_qs, urlsplit
+
+import sawi
+
+MAKS_BODY = 1024 * 1024
+
+# Rentang INTEGER SQLite (64-bit bertanda); di luar ini sqlite3 gagal bind
+INT_MIN = -2 ** 63
+INT_MAKS = 2 ** 63 - 1
+
+# Format nomor dari sawi.get_nomor_nota: CS/DDMMYY/NNNN
+POLA_NOTA = re.compile(r"^CS/(\d{6})/(\d{4,})$")
+
+STATUS_TEKS = {
+    200: "OK",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    409: "Conflict",
+    413: "Payload Too Large",
+    500: "Internal Server Error",
+}
+
+# Semua penulisan lewat satu thread supaya tidak saling berebut kunci tulis
+# SQLite; pembacaan memakai thread pool bawaan dan berjalan paralel (mode WAL).
+penulis = ThreadPoolExecutor(max_workers=1, thread_name_prefix="api-tulis")
+_lokal = threading.local()
+
+
+class ApiError(Exception):
+    def __init__(self, status, pesan):
+        super().__init__(pesan)
+        self.status = status
+        self.pesan = pesan
+
+
+# ---------- FUNGSI DATABASE ----------
+def koneksi():
+    """Koneksi SQLite per thread, dibuka sekali lalu dipakai ulang"""
+    conn = getattr(_lokal, "conn", None)
+    if conn is None:
+        conn = sqlite3.connect('kasir.db', timeout=30)
+        conn.execute("PRAGMA foreign_keys = ON")
+        conn.row_factory = sqlite3.Row
+        _lokal.conn = conn
+    return conn
+
+def ambil_int(data, kunci, minimal=None):
+    nilai = data.get(kunci) if isinstance(data, dict) else None
+    if (not isinstance(nilai, int) or isinstance(nilai, bool) or not INT_MIN <= nilai <= INT_MAKS
+            or (minimal is not None and nilai < minimal)):
+        raise ApiError(400, f"'{kunci}' harus bilangan bulat 64-bit" + (f" >= {minimal}" if minimal is not None else ""))
+    return nilai
+
+def validasi_kasir(conn, data):
+    kasir = data.get("kasir") if isinstance(data, dict) else None
+    if not kasir or conn.execute("SELECT 1 FROM users WHERE username = ?", (kasir,)).fetchone() is None:
+        raise ApiError(400, "Kasir tidak terdaftar.")
+    return kasir
+
+def validasi_metode_bayar(data):
+    metode_bayar = data.get("metode_bayar", "Kartu Debit/Kredit")
+    if metode_bayar not in sawi.METODE_BAYAR:
+        raise ApiError(400, f"Metode pembayaran harus salah satu dari {sawi.METODE_BAYAR}")
+    return metode_bayar
+
+def validasi_nota(conn, data):
+    """Nota hasil POST /nota yang belum dipakai, atau None bila tidak dikirim"""
+    nota = data.get("nota")
+    if nota is None:
+        return None
+    cocok = POLA_NOTA.match(nota) if isinstance(nota, str) else None
+    if cocok is None:
+        raise ApiError(400, "'nota' harus berformat CS/DDMMYY/NNNN.")
+
+    # Hanya nomor yang sudah dialokasikan, supaya tidak bentrok dengan POST /nota berikutnya
+    row = conn.execute("SELECT nomor FROM nomor_nota WHERE tanggal = ?", (cocok.group(1),)).fetchone()
+    if row is None or int(cocok.group(2)) > row[0]:
+        raise ApiError(400, f"Nota {nota} belum dialokasikan lewat POST /nota.")
+    if conn.execute("SELECT 1 FROM transaksi WHERE nota = ?", (nota,)).fetchone() is not None:
+        raise ApiError(409, f"Nota {nota} sudah dipakai.")
+    return nota
+
+def susun_keranjang(conn, items):
+    """Ubah [{"produk_id", "qty"}] menjadi keranjang (produk_id, nama, harga, qty) dengan harga dari database"""
+    if not isinstance(items, list) or not items:
+        raise ApiError(400, "'items' harus berisi minimal satu produk.")
+
+    pesanan = [(ambil_int(item, "produk_id"), ambil_int(item, "qty", 1)) for item in items]
+    ids = sorted({produk_id for produk_id, _ in pesanan})
+    tanda = ",".join("?" * len(ids))
+    produk = {
+        row["id"]: row
+        for row in conn.execute(f"SELECT id, nama, harga FROM produk WHERE id IN ({tanda})", ids).fetchall()
+    }
+
+    keranjang = []
+    for produk_id, qty in pesanan:
+        if produk_id not in produk:
+            raise ApiError(404, f"Produk {produk_id} tidak ditemukan.")
+        keranjang.append((produk_id, produk[produk_id]["nama"], produk[produk_id]["harga"], qty))
+    return keranjang
+
+def hasil_checkout(nomor_nota, now, keranjang, metode_bayar):
+    return {
+        "nota": nomor_nota,
+        "waktu": now.isoformat(),
+        "metode_bayar": metode_bayar,
+        "total": sum(harga * qty for _, _, harga, qty in keranjang),
+        "items": [
+            {"produk_id": produk_id, "nama": nama, "harga": harga, "qty": qty}
+            for produk_id, nama, harga, qty in keranjang
+        ],
+        "struk": "\n".join(sawi.buat_struk(nomor_nota, now, keranjang, metode_bayar)),
+    }
+
+def checkout_satu(conn, data):
+    """Satu checkout di dalam transaksi yang sudah dibuka pemanggil"""
+    kasir = validasi_kasir(conn, data)
+    metode_bayar = validasi_metode_bayar(data)
+    nota = validasi_nota(conn, data)
+    keranjang = susun_keranjang(conn, data.get("items"))
+    if sum(harga * qty for _, _, harga, qty in keranjang) > INT_MAKS:
+        raise ApiError(400, "Total transaksi terlalu besar.")
+    try:
+        nomor_nota, now = sawi.proses_checkout(conn, keranjang, kasir, metode_bayar, nota)
+    except sawi.StokTidakCukup as e:
+        raise ApiError(409, f"Stok {e} tidak cukup!")
+    return hasil_checkout(nomor_nota, now, keranjang, metode_bayar)
+
+# ---------- HANDLER ----------
+def get_produk(params, data, cocok):
+    conn = koneksi()
+    query = "SELECT id, nama, harga, stok, gambar FROM produk WHERE 1 = 1"
+    args = []
+
+    if cocok and cocok.group(1):
+        produk_id = int(cocok.group(1))
+        if produk_id > INT_MAKS:
+            raise ApiError(404, "Produk tidak ditemukan.")
+        query += " AND id = ?"
+        args.append(produk_id)
+    if params.get("q"):
+        query += " AND nama LIKE ?"
+        args.append(f"%{params['q'][0]}%")
+    if params.get("tersedia", ["0"])[0] == "1":
+        query += " AND stok > 0"
+    if params.get("ids"):
+        try:
+            ids = [int(x) for x in params["ids"][0].split(",") if x]
+        except ValueError:
+            raise ApiError(400, "'ids' harus daftar angka dipisah koma.")
+        if any(not INT_MIN <= produk_id <= INT_MAKS for produk_id in ids):
+            raise ApiError(400, "'ids' harus bilangan bulat 64-bit.")
+        query += f" AND id IN ({','.join('?' * len(ids))})"
+        args += ids
+
+    produk = [dict(row) for row in conn.execute(query + " ORDER BY nama", args).fetchall()]
+    if cocok and cocok.group(1):
+        if not produk:
+            raise ApiError(404, "Produk tidak ditemukan.")
+        return produk[0]
+    return {"produk": produk}
+
+def post_stok(params, data, cocok):
+    perubahan = data.get("perubahan") if isinstance(data, dict) else None
+    if not isinstance(perubahan, list) or not perubahan:
+        raise ApiError(400, "'perubahan' harus berisi minimal satu produk.")
+    perubahan = [(ambil_int(item, "produk_id"), ambil_int(item, "stok", 0)) for item in perubahan]
+
+    conn = koneksi()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        tidak_ditemukan = sawi.ubah_stok_massal(conn, perubahan)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return {"diubah": len(perubahan) - len(tidak_ditemukan), "tidak_ditemukan": tidak_ditemukan}
+
+def post_nota(params, data, cocok):
+    conn = koneksi()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        nomor_nota = sawi.get_nomor_nota(conn)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return {"nota": nomor_nota}
+
+def post_checkout(params, data, cocok):
+    conn = koneksi()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        hasil = checkout_satu(conn, data)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return hasil
+
+def post_checkout_batch(params, data, cocok):
+    """Banyak checkout dalam satu transaksi tulis; kegagalan satu keranjang tidak membatalkan yang lain"""
+    daftar = data.get("transaksi") if isinstance(data, dict) else None
+    if not isinstance(daftar, list) or not daftar:
+        raise ApiError(400, "'transaksi' harus berisi minimal satu checkout.")
+
+    conn = koneksi()
+    hasil = []
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        for isi in daftar:
+            conn.execute("SAVEPOINT checkout")
+            try:
+                hasil.append(checkout_satu(conn, isi))
+            except ApiError as e:
+                conn.execute("ROLLBACK TO checkout")
+                hasil.append({"status": e.status, "error": e.pesan})
+            conn.execute("RELEASE checkout")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return {"hasil": hasil}
+
+def get_laporan(params, data, cocok):
+    hari_ini = sawi.get_indonesia_time().strftime("%Y-%m-%d")
+    dari = params.get("dari", [hari_ini])[0]
+    sampai = params.get("sampai", [dari])[0]
+    for tanggal in (dari, sampai):
+        try:
+            datetime.strptime(tanggal, "%Y-%m-%d")
+        except ValueError:
+            raise ApiError(400, "Tanggal harus berformat YYYY-MM-DD.")
+
+    hasil = sawi.ringkasan_penjualan(koneksi(), dari, sampai)
+    hasil.update({"dari": dari, "sampai": sampai})
+    return hasil
+
+# (metode, pola path, handler, menulis ke database)
+RUTE = [
+    ("GET", re.compile(r"^/produk(?:/(\d+))?$"), get_produk, False),
+    ("POST", re.compile(r"^/produk/stok$"), post_stok, True),
+    ("POST", re.compile(r"^/nota$"), post_nota, True),
+    ("POST", re.compile(r"^/checkout$"), post_checkout, True),
+    ("POST", re.compile(r"^/checkout/batch$"), post_checkout_batch, True),
+    ("GET", re.compile(r"^/laporan$"), get_laporan, False),
+]
+
+# ---------- SERVER HTTP ----------
+async def proses_request(metode, target, body):
+    url = urlsplit(target)
+    params = parse_qs(url.query)
+
+    cocok_path = [(m, pola.match(url.path), handler, tulis) for m, pola, handler, tulis in RUTE]
+    cocok_path = [rute for rute in cocok_path if rute[1]]
+    if not cocok_path:
+        return 404, {"error": "Endpoint tidak ditemukan."}
+    rute = [r for r in cocok_path if r[0] == metode]
+    if not rute:
+        return 405, {"error": "Metode tidak didukung."}
+    _, cocok, handler, tulis = rute[0]
+
+    try:
+        data = json.loads(body) if body else {}
+    except (ValueError, UnicodeDecodeError):
+        return 400, {"error": "Body harus JSON."}
+
+    loop = asyncio.get_running_loop()
+    try:
+        hasil = await loop.run_in_executor(penulis if tulis else None, handler, params, data, cocok)
+    except ApiError as e:
+        return e.status, {"error": e.pesan}
+    except sqlite3.Error as e:
+        return 500, {"error": f"Kesalahan database: {e}"}
+    except Exception as e:
+        return 500, {"error": f"Terjadi kesalahan: {e}"}
+    return 200, hasil
+
+def tulis_respons(writer, status, data, tetap_hidup):
+    body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+    header = (
+        f"HTTP/1.1 {status} {STATUS_TEKS.get(status, '')}\r\n"
+        "Content-Type: application/json; charset=utf-8\r\n"
+        f"Content-Length: {len(body)}\r\n"
+        f"Connection: {'keep-alive' if tetap_hidup else 'close'}\r\n"
+        "\r\n"
+    )
+    writer.write(header.encode("latin-1") + body)
+
+async def tangani_koneksi(reader, writer):
+    """Layani satu koneksi TCP; koneksi keep-alive dipakai untuk banyak request"""
+    try:
+        while True:
+            baris = await reader.readline()
+            if not baris:
+                break
+            try:
+                metode, target, versi = baris.decode("latin-1").split()
+            except ValueError:
+                tulis_respons(writer, 400, {"error": "Request tidak valid."}, False)
+                break
+
+            headers = {}
+            while True:
+                baris_header = await reader.readline()
+                if baris_header in (b"\r\n", b"\n", b""):
+                    break
+                kunci, _, nilai = baris_header.decode("latin-1").partition(":")
+                headers[kunci.strip().lower()] = nilai.strip()
+
+            koneksi_header = headers.get("connection", "").lower()
+            tetap_hidup = koneksi_header == "keep-alive" or (versi == "HTTP/1.1" and koneksi_header != "close")
+
+            try:
+                panjang = int(headers.get("content-length", "0"))
+            except ValueError:
+                panjang = -1
+            if panjang < 0 or panjang > MAKS_BODY:
+                tulis_respons(writer, 413 if panjang > MAKS_BODY else 400, {"error": "Content-Length tidak valid."}, False)
+                break
+            body = await reader.readexactly(panjang) if panjang else b""
+
+            status, data = await proses_request(metode.upper(), target, body)
+            tulis_respons(writer, status, data, tetap_hidup)
+            await writer.drain()
+            if not tetap_hidup:
+                break
+    except (asyncio.IncompleteReadError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+async def jalankan(host, port):
+    server = await asyncio.start_server(tangani_koneksi, host, port)
+    print(f"API kasir berjalan di http://{host}:{port}")
+    async with server:
+        await server.serve_forever()
+
+def main():
+    parser = argparse.ArgumentParser(description="API HTTP/JSON lokal untuk kasir")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8502)
+    args = parser.parse_args()
+
+    sawi.init_db()
+    try:
+        asyncio.run(jalankan(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,447 @@
+"""Backup online kasir.db tanpa menahan kasir.
+
+Pemakaian:
+    python backup.py buat                 # snapshot baru (gzip + sha256)
+    python backup.py wal                  # kirim potongan WAL sejak pengiriman terakhir
+    python backup.py daftar               # tampilkan snapshot yang tersedia
+    python backup.py verifikasi NAMA      # uji pulihkan ke file sementara
+    python backup.py pulihkan NAMA        # pulihkan ke kasir.db setelah diverifikasi
+    python backup.py jalankan             # layanan: snapshot per jam, WAL per menit
+    python backup.py aktifkan-auto-vacuum # sekali, di luar jam buka (VACUUM penuh)
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import struct
+import tempfile
+import time
+from datetime import datetime, timezone
+
+DB_PATH = "kasir.db"
+BACKUP_DIR = "data/backup"
+
+# Ukuran header file WAL dan header tiap frame (lihat format WAL SQLite)
+WAL_HEADER = 32
+WAL_FRAME_HEADER = 24
+
+
+class BackupDiulang(Exception):
+    """Backup bertahap terus diulang karena database sering berubah"""
+
+
+class BackupRusak(Exception):
+    """File backup tidak lolos verifikasi checksum atau integrity_check"""
+
+
+class WalDireset(Exception):
+    """WAL sudah di-reset sejak snapshot terakhir sehingga perlu snapshot baru"""
+
+
+# ---------- FUNGSI BANTU ----------
+def sha256_file(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for blok in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(blok)
+    return h.hexdigest()
+
+def gzip_file(sumber, tujuan):
+    with open(sumber, "rb") as f_in, gzip.open(tujuan, "wb") as f_out:
+        shutil.copyfileobj(f_in, f_out)
+
+def path_manifest(nama, tujuan=BACKUP_DIR):
+    return os.path.join(tujuan, f"{nama}.json")
+
+def baca_manifest(nama, tujuan=BACKUP_DIR):
+    with open(path_manifest(nama, tujuan)) as f:
+        return json.load(f)
+
+def tulis_manifest(manifest, tujuan=BACKUP_DIR):
+    # Tulis ke file sementara lalu rename agar manifest tidak pernah setengah jadi
+    path = path_manifest(manifest["nama"], tujuan)
+    with open(path + ".tmp", "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(path + ".tmp", path)
+
+def daftar_snapshot(tujuan=BACKUP_DIR):
+    """Nama snapshot yang punya manifest, urut dari yang terlama"""
+    if not os.path.isdir(tujuan):
+        return []
+    return sorted(
+        nama_file[:-len(".json")]
+        for nama_file in os.listdir(tujuan)
+        if nama_file.startswith("kasir_") and nama_file.endswith(".json")
+    )
+
+# ---------- FUNGSI WAL ----------
+def baca_header_wal(db_path=DB_PATH):
+    """Kembalikan (big_endian, page_size, salt1, salt2, cksum1, cksum2) atau None"""
+    try:
+        with open(db_path + "-wal", "rb") as f:
+            header = f.read(WAL_HEADER)
+    except FileNotFoundError:
+        return None
+    if len(header) < WAL_HEADER:
+        return None
+
+    magic, _, page_size, _, salt1, salt2, cksum1, cksum2 = struct.unpack(">8I", header)
+    if magic not in (0x377F0682, 0x377F0683):
+        return None
+    if page_size == 1:
+        page_size = 65536
+    return magic & 1 == 1, page_size, salt1, salt2, cksum1, cksum2
+
+def checksum_wal(data, s0, s1, big_endian):
+    """Checksum kumulatif WAL SQLite atas data kelipatan 8 byte"""
+    kata = struct.unpack(f"{'>' if big_endian else '<'}{len(data) // 4}I", data)
+    for i in range(0, len(kata), 2):
+        s0 = (s0 + kata[i] + s1) & 0xFFFFFFFF
+        s1 = (s1 + kata[i + 1] + s0) & 0xFFFFFFFF
+    return s0, s1
+
+def batas_commit_wal(data, offset, header):
+    """Cari akhir frame commit terakhir yang valid pada data WAL mulai dari offset.
+
+    Frame yang checksum-nya tidak cocok (misalnya sedang ditulis kasir)
+    dianggap belum ada, jadi potongan yang dikirim selalu berakhir di
+    batas transaksi yang utuh.
+    """
+    big_endian, page_size, salt1, salt2, cksum1, cksum2 = header
+    ukuran_frame = WAL_FRAME_HEADER + page_size
+
+    if offset == 0:
+        posisi = WAL_HEADER
+        s0, s1 = cksum1, cksum2
+    else:
+        # Checksum kumulatif dilanjutkan dari frame terakhir yang sudah dikirim
+        posisi = offset
+        s0, s1 = struct.unpack(">2I", data[offset - ukuran_frame + 16:offset - ukuran_frame + 24])
+
+    batas = offset
+    while posisi + ukuran_frame <= len(data):
+        frame = data[posisi:posisi + ukuran_frame]
+        _, commit, f_salt1, f_salt2, f_cksum1, f_cksum2 = struct.unpack(">6I", frame[:WAL_FRAME_HEADER])
+        if (f_salt1, f_salt2) != (salt1, salt2):
+            break
+        s0, s1 = checksum_wal(frame[:8], s0, s1, big_endian)
+        s0, s1 = checksum_wal(frame[WAL_FRAME_HEADER:], s0, s1, big_endian)
+        if (s0, s1) != (f_cksum1, f_cksum2):
+            break
+        posisi += ukuran_frame
+        if commit:
+            batas = posisi
+    return batas
+
+# ---------- FUNGSI SNAPSHOT ----------
+def buat_snapshot(db_path=DB_PATH, tujuan=BACKUP_DIR, halaman_per_langkah=64, jeda=0.01,
+                  maks_ulang=5, simpan=14):
+    """Salin database dengan online backup API sedikit demi sedikit.
+
+    Tiap langkah hanya menyalin beberapa halaman lalu melepas kunci sehingga
+    checkout di sela langkah tetap jalan. Bila tulisan kasir membuat backup
+    terus mengulang dari awal, sisa salinan dilakukan sekaligus; pada mode
+    WAL pembacaan ini tidak menahan penulis.
+    """
+    os.makedirs(tujuan, exist_ok=True)
+    # Nama memakai UTC agar urutannya sama walau proses berjalan dengan TZ berbeda
+    dibuat = datetime.now(timezone.utc)
+    nama = f"kasir_{dibuat.strftime('%Y%m%d_%H%M%S_%f')}"
+    path_tmp = os.path.join(tujuan, f"{nama}.db.tmp")
+    path_gz = os.path.join(tujuan, f"{nama}.db.gz")
+
+    header_sebelum = baca_header_wal(db_path)
+    stat_sebelum = os.stat(db_path)
+    sisa_terakhir = [None, 0]
+
+    def pantau(status, sisa, total):
+        # Sisa halaman yang naik lagi berarti backup diulang dari awal
+        if sisa_terakhir[0] is not None and sisa > sisa_terakhir[0]:
+            sisa_terakhir[1] += 1
+            if sisa_terakhir[1] > maks_ulang:
+                raise BackupDiulang()
+        sisa_terakhir[0] = sisa
+
+    src = sqlite3.connect(db_path, timeout=30)
+    dst = sqlite3.connect(path_tmp)
+    try:
+        try:
+            src.backup(dst, pages=halaman_per_langkah, progress=pantau, sleep=jeda)
+        except BackupDiulang:
+            src.backup(dst, pages=-1)
+    finally:
+        dst.close()
+        src.close()
+
+    header_sesudah = baca_header_wal(db_path)
+
+    gzip_file(path_tmp, path_gz)
+    os.remove(path_tmp)
+
+    # Salt WAL hanya dicatat bila WAL tidak di-reset selama backup berjalan,
+    # karena hanya dengan begitu frame WAL berikutnya bisa diterapkan ke snapshot ini
+    wal_salt = None
+    if header_sebelum and header_sesudah and header_sebelum[2:4] == header_sesudah[2:4]:
+        wal_salt = list(header_sesudah[2:4])
+
+    # WAL masih kosong saat backup mulai (toko sepi): semua perubahan sesudahnya
+    # akan masuk WAL baru. Salt-nya dicatat kirim_wal begitu header WAL muncul,
+    # selama file database belum tersentuh checkpoint sejak titik ini.
+    wal_menunggu = None
+    if header_sebelum is None:
+        wal_menunggu = {"mtime_ns": stat_sebelum.st_mtime_ns, "ukuran": stat_sebelum.st_size}
+
+    manifest = {
+        "nama": nama,
+        "dibuat": dibuat.isoformat(),
+        "snapshot": os.path.basename(path_gz),
+        "sha256": sha256_file(path_gz),
+        "wal_salt": wal_salt,
+        "wal_menunggu": wal_menunggu,
+        "wal": [],
+    }
+    tulis_manifest(manifest, tujuan)
+
+    rotasi_snapshot(tujuan, simpan)
+    return manifest
+
+def kirim_wal(db_path=DB_PATH, tujuan=BACKUP_DIR):
+    """Kirim frame WAL yang sudah commit sejak pengiriman terakhir.
+
+    Mengembalikan manifest snapshot terakhir (tidak berubah bila belum ada
+    frame baru), atau None bila belum ada snapshot sama sekali. Melempar
+    WalDireset bila WAL sudah di-reset sejak snapshot sehingga perlu
+    snapshot baru.
+    """
+    semua = daftar_snapshot(tujuan)
+    if not semua:
+        return None
+    manifest = baca_manifest(semua[-1], tujuan)
+
+    header = baca_header_wal(db_path)
+    if header is None:
+        return manifest
+
+    if manifest["wal_salt"] is None:
+        menunggu = manifest.get("wal_menunggu")
+        stat = os.stat(db_path)
+        if menunggu is None or (stat.st_mtime_ns, stat.st_size) != (menunggu["mtime_ns"], menunggu["ukuran"]):
+            raise WalDireset()
+        manifest["wal_salt"] = list(header[2:4])
+        manifest["wal_menunggu"] = None
+        tulis_manifest(manifest, tujuan)
+    elif list(header[2:4]) != manifest["wal_salt"]:
+        raise WalDireset()
+
+    with open(db_path + "-wal", "rb") as f:
+        data = f.read()
+
+    offset = manifest["wal"][-1]["sampai"] if manifest["wal"] else 0
+    batas = batas_commit_wal(data, offset, header)
+    if batas <= offset:
+        return manifest
+
+    nama_potongan = f"{manifest['nama']}.wal{len(manifest['wal']) + 1:04d}.gz"
+    path_potongan = os.path.join(tujuan, nama_potongan)
+    with gzip.open(path_potongan, "wb") as f:
+        f.write(data[offset:batas])
+
+    manifest["wal"].append({
+        "file": nama_potongan,
+        "sha256": sha256_file(path_potongan),
+        "offset": offset,
+        "sampai": batas,
+    })
+    tulis_manifest(manifest, tujuan)
+    return manifest
+
+def rotasi_snapshot(tujuan=BACKUP_DIR, simpan=14):
+    """Hapus snapshot terlama beserta potongan WAL-nya, sisakan `simpan` terbaru"""
+    semua = daftar_snapshot(tujuan)
+    for nama in semua[:max(len(semua) - simpan, 0)]:
+        manifest = baca_manifest(nama, tujuan)
+        for nama_file in [manifest["snapshot"]] + [w["file"] for w in manifest["wal"]]:
+            path = os.path.join(tujuan, nama_file)
+            if os.path.exists(path):
+                os.remove(path)
+        os.remove(path_manifest(nama, tujuan))
+
+# ---------- FUNGSI PEMULIHAN ----------
+def siapkan_pemulihan(nama, folder_kerja, tujuan=BACKUP_DIR, pakai_wal=True):
+    """Bangun ulang database dari snapshot (+ WAL) lalu verifikasi isinya"""
+    manifest = baca_manifest(nama, tujuan)
+    berkas = [(manifest["snapshot"], manifest["sha256"])]
+    if pakai_wal:
+        berkas += [(w["file"], w["sha256"]) for w in manifest["wal"]]
+
+    for nama_file, checksum in berkas:
+        if sha256_file(os.path.join(tujuan, nama_file)) != checksum:
+            raise BackupRusak(f"Checksum {nama_file} tidak cocok")
+
+    path_db = os.path.join(folder_kerja, "pulih.db")
+    with gzip.open(os.path.join(tujuan, manifest["snapshot"]), "rb") as f_in, open(path_db, "wb") as f_out:
+        shutil.copyfileobj(f_in, f_out)
+
+    if pakai_wal and manifest["wal"]:
+        with open(path_db + "-wal", "wb") as f_out:
+            for w in manifest["wal"]:
+                with gzip.open(os.path.join(tujuan, w["file"]), "rb") as f_in:
+                    shutil.copyfileobj(f_in, f_out)
+
+    conn = sqlite3.connect(path_db)
+    try:
+        hasil = conn.execute("PRAGMA integrity_check").fetchone()[0]
+        if hasil != "ok":
+            raise BackupRusak(f"integrity_check gagal: {hasil}")
+        if conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal":
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    finally:
+        conn.close()
+    return path_db
+
+def verifikasi(nama, tujuan=BACKUP_DIR, pakai_wal=True):
+    """Uji pulihkan ke folder sementara tanpa menyentuh database aktif"""
+    with tempfile.TemporaryDirectory() as folder_kerja:
+        path_db = siapkan_pemulihan(nama, folder_kerja, tujuan, pakai_wal)
+        conn = sqlite3.connect(path_db)
+        try:
+            return {
+                row[0]: conn.execute(f'SELECT count(*) FROM "{row[0]}"').fetchone()[0]
+                for row in conn.execute("SELECT name FROM sqlite_master WHERE type IN ('table', 'view') AND name NOT LIKE 'sqlite_%'")
+            }
+        finally:
+            conn.close()
+
+def pulihkan(nama, db_path=DB_PATH, tujuan=BACKUP_DIR, pakai_wal=True):
+    """Pulihkan snapshot yang sudah diverifikasi ke database aktif.
+
+    Isi disalin dengan online backup API sehingga koneksi lain yang masih
+    terbuka langsung melihat data hasil pemulihan.
+    """
+    with tempfile.TemporaryDirectory() as folder_kerja:
+        path_db = siapkan_pemulihan(nama, folder_kerja, tujuan, pakai_wal)
+        src = sqlite3.connect(path_db)
+        dst = sqlite3.connect(db_path, timeout=30)
+        try:
+            src.backup(dst)
+        finally:
+            dst.close()
+            src.close()
+
+# ---------- PEMELIHARAAN OFFLINE ----------
+def aktifkan_auto_vacuum(db_path=DB_PATH):
+    """Ubah database ke auto_vacuum=INCREMENTAL dengan satu VACUUM penuh.
+
+    VACUUM memegang kunci tulis selama berjalan, jadi jalankan saat kasir
+    tutup. Setelah itu kompaksi terjadwal di sawi.py bisa berjalan per
+    langkah kecil. Mengembalikan False bila database sudah dikonversi.
+    """
+    conn = sqlite3.connect(db_path, timeout=30)
+    try:
+        if conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+            return False
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.execute("VACUUM")
+        return True
+    finally:
+        conn.close()
+
+# ---------- LAYANAN ----------
+def jalankan(db_path=DB_PATH, tujuan=BACKUP_DIR, interval_snapshot=60 * 60, interval_wal=60, simpan=14):
+    """Loop backup: snapshot berkala, potongan WAL di antaranya"""
+    # Koneksi ini dibiarkan terbuka supaya file -wal tidak dihapus setiap kali
+    # koneksi kasir terakhir ditutup
+    conn = sqlite3.connect(db_path, timeout=30)
+    mode_wal = conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+
+    # Lanjutkan jadwal dari snapshot terakhir agar restart layanan tidak
+    # langsung membuat snapshot baru
+    semua = daftar_snapshot(tujuan)
+    terakhir = 0
+    if semua:
+        terakhir = datetime.fromisoformat(baca_manifest(semua[-1], tujuan)["dibuat"]).timestamp()
+    try:
+        while True:
+            perlu_snapshot = time.time() - terakhir >= interval_snapshot
+            if not perlu_snapshot and mode_wal:
+                try:
+                    perlu_snapshot = kirim_wal(db_path, tujuan) is None
+                except WalDireset:
+                    perlu_snapshot = True
+            if perlu_snapshot:
+                manifest = buat_snapshot(db_path, tujuan, simpan=simpan)
+                terakhir = time.time()
+                print(f"Snapshot {manifest['snapshot']} dibuat")
+            time.sleep(interval_wal if mode_wal else interval_snapshot)
+    finally:
+        conn.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Backup online kasir.db")
+    parser.add_argument("--db", default=DB_PATH, help="lokasi database (default: kasir.db)")
+    parser.add_argument("--folder", default=BACKUP_DIR, help="folder backup (default: data/backup)")
+    sub = parser.add_subparsers(dest="perintah", required=True)
+
+    p_buat = sub.add_parser("buat", help="buat snapshot baru")
+    p_buat.add_argument("--simpan", type=int, default=14, help="jumlah snapshot yang disimpan")
+    sub.add_parser("wal", help="kirim potongan WAL terbaru")
+    sub.add_parser("daftar", help="tampilkan snapshot")
+    for nama_perintah in ("verifikasi", "pulihkan"):
+        p = sub.add_parser(nama_perintah)
+        p.add_argument("nama", nargs="?", help="nama snapshot (default: terbaru)")
+        p.add_argument("--tanpa-wal", action="store_true", help="abaikan potongan WAL")
+    sub.add_parser("aktifkan-auto-vacuum", help="konversi ke auto_vacuum=INCREMENTAL (di luar jam buka)")
+    p_jalan = sub.add_parser("jalankan", help="jalankan layanan backup")
+    p_jalan.add_argument("--interval-snapshot", type=int, default=60 * 60)
+    p_jalan.add_argument("--interval-wal", type=int, default=60)
+    p_jalan.add_argument("--simpan", type=int, default=14)
+    args = parser.parse_args()
+
+    if args.perintah == "buat":
+        manifest = buat_snapshot(args.db, args.folder, simpan=args.simpan)
+        print(f"Snapshot {manifest['snapshot']} dibuat ({manifest['sha256'][:12]})")
+
+    elif args.perintah == "wal":
+        try:
+            manifest = kirim_wal(args.db, args.folder)
+        except WalDireset:
+            parser.exit(1, "WAL sudah di-reset sejak snapshot terakhir, jalankan 'buat' dulu.\n")
+        if manifest is None:
+            parser.error("Belum ada snapshot, jalankan 'buat' dulu.")
+        print(f"{len(manifest['wal'])} potongan WAL untuk {manifest['nama']}")
+
+    elif args.perintah == "daftar":
+        for nama in daftar_snapshot(args.folder):
+            manifest = baca_manifest(nama, args.folder)
+            print(f"{nama}  {manifest['dibuat']}  {len(manifest['wal'])} potongan WAL")
+
+    elif args.perintah in ("verifikasi", "pulihkan"):
+        semua = daftar_snapshot(args.folder)
+        nama = args.nama or (semua[-1] if semua else None)
+        if nama is None:
+            parser.error("Belum ada snapshot.")
+        try:
+            if args.perintah == "verifikasi":
+                for tabel, jumlah in verifikasi(nama, args.folder, not args.tanpa_wal).items():
+                    print(f"{tabel}: {jumlah} baris")
+                print(f"Snapshot {nama} valid.")
+            else:
+                pulihkan(nama, args.db, args.folder, not args.tanpa_wal)
+                print(f"{args.db} dipulihkan dari {nama}.")
+        except BackupRusak as e:
+            parser.exit(1, f"Gagal: {e}\n")
+
+    elif args.perintah == "aktifkan-auto-vacuum":
+        if aktifkan_auto_vacuum(args.db):
+            print(f"{args.db} sekarang memakai auto_vacuum=INCREMENTAL.")
+        else:
+            print(f"{args.db} sudah memakai auto_vacuum=INCREMENTAL.")
+
+    elif args.perintah == "jalankan":
+        jalankan(args.db, args.folder, args.interval_snapshot, args.interval_wal, args.simpan)
+
+if __name__ == "__main__":
+    main()
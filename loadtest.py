@@ -0,0 +1,103 @@
+"""Uji beban sederhana untuk api.py.
+
+Membuka banyak koneksi keep-alive sekaligus (seperti banyak terminal kasir)
+lalu mengukur throughput dan latensi tiap request.
+
+    python loadtest.py --koneksi 50 --request 200 --skenario katalog
+    python loadtest.py --skenario checkout --kasir sinda --produk-id 19
+    python loadtest.py --skenario batch --kasir sinda --produk-id 19 --ukuran-batch 20
+"""
+import argparse
+import asyncio
+import json
+import time
+from collections import Counter
+
+
+async def kirim(reader, writer, host, metode, path, data=None):
+    body = json.dumps(data).encode("utf-8") if data is not None else b""
+    header = (
+        f"{metode} {path} HTTP/1.1\r\n"
+        f"Host: {host}\r\n"
+        "Content-Type: application/json\r\n"
+        f"Content-Length: {len(body)}\r\n"
+        "\r\n"
+    )
+    writer.write(header.encode("latin-1") + body)
+    await writer.drain()
+
+    status = int((await reader.readline()).split()[1])
+    panjang = 0
+    while True:
+        baris = await reader.readline()
+        if baris in (b"\r\n", b""):
+            break
+        kunci, _, nilai = baris.decode("latin-1").partition(":")
+        if kunci.strip().lower() == "content-length":
+            panjang = int(nilai)
+    await reader.readexactly(panjang)
+    return status
+
+def buat_request(args, urutan):
+    if args.skenario == "katalog":
+        if args.produk_id is not None and urutan % 2:
+            return "GET", f"/produk/{args.produk_id}", None
+        return "GET", "/produk?tersedia=1", None
+
+    checkout = {
+        "kasir": args.kasir,
+        "metode_bayar": "Tunai",
+        "items": [{"produk_id": args.produk_id, "qty": 1}],
+    }
+    if args.skenario == "checkout":
+        return "POST", "/checkout", checkout
+    return "POST", "/checkout/batch", {"transaksi": [checkout] * args.ukuran_batch}
+
+async def terminal(args, latensi, status_counter):
+    reader, writer = await asyncio.open_connection(args.host, args.port)
+    try:
+        for urutan in range(args.request):
+            metode, path, data = buat_request(args, urutan)
+            mulai = time.perf_counter()
+            status = await kirim(reader, writer, args.host, metode, path, data)
+            latensi.append(time.perf_counter() - mulai)
+            status_counter[status] += 1
+    finally:
+        writer.close()
+
+def persentil(data, p):
+    data = sorted(data)
+    return data[min(int(len(data) * p / 100), len(data) - 1)] * 1000
+
+async def utama(args):
+    latensi = []
+    status_counter = Counter()
+
+    mulai = time.perf_counter()
+    await asyncio.gather(*(terminal(args, latensi, status_counter) for _ in range(args.koneksi)))
+    durasi = time.perf_counter() - mulai
+
+    print(f"Skenario      : {args.skenario}")
+    print(f"Koneksi       : {args.koneksi}")
+    print(f"Total request : {len(latensi)} dalam {durasi:.2f} detik ({len(latensi) / durasi:.0f} req/detik)")
+    print(f"Latensi (ms)  : p50 {persentil(latensi, 50):.1f} | p95 {persentil(latensi, 95):.1f} | p99 {persentil(latensi, 99):.1f}")
+    print(f"Status        : {dict(status_counter)}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Uji beban API kasir")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8502)
+    parser.add_argument("--koneksi", type=int, default=20, help="jumlah terminal bersamaan")
+    parser.add_argument("--request", type=int, default=100, help="request per terminal")
+    parser.add_argument("--skenario", choices=["katalog", "checkout", "batch"], default="katalog")
+    parser.add_argument("--kasir", default="", help="username kasir untuk skenario checkout")
+    parser.add_argument("--produk-id", type=int, help="produk untuk lookup detail / checkout")
+    parser.add_argument("--ukuran-batch", type=int, default=10)
+    args = parser.parse_args()
+
+    if args.skenario != "katalog" and (not args.kasir or args.produk_id is None):
+        parser.error("--kasir dan --produk-id wajib diisi untuk skenario checkout/batch.")
+    asyncio.run(utama(args))
+
+if __name__ == "__main__":
+    main()
@@ -3,10 +3,12 @@ import pandas as pd
 import os 
 import io 
 import sqlite3 
-from datetime import datetime
+from datetime import date, datetime, timedelta
 import pytz
 from fpdf import FPDF 
 import tempfile
+import threading
+import traceback
 
 os.environ['TZ'] = 'Asia/Jakarta'
 try:
@@ -15,6 +17,11 @@ try:
 except:
     pass
 
+# Lokasi file arsip riwayat per bulan (riwayat_YYYYMM.db)
+ARSIP_DIR = "data/arsip"
+
+METODE_BAYAR = ["Tunai", "Kartu Debit/Kredit", "QRIS"]
+
 def adapt_datetime(val): 
     return val.isoformat()
 
@@ -39,6 +46,9 @@ def init_db():
     # Register adapter datetime
     sqlite3.register_adapter(datetime, adapt_datetime)
     
+    # Mode WAL: pembaca (laporan, backup) tidak menahan checkout
+    conn.execute("PRAGMA journal_mode=WAL")
+    
     c = conn.cursor()
     
     # Tabel users
@@ -60,18 +70,34 @@ def init_db():
     )
     ''')
     
-    # Tabel riwayat transaksi
+    # Tabel transaksi (satu baris per nota)
     c.execute('''
-    CREATE TABLE IF NOT EXISTS riwayat (
+    CREATE TABLE IF NOT EXISTS transaksi (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
-        nama TEXT NOT NULL,
-        harga INTEGER NOT NULL,
-        qty INTEGER NOT NULL,
+        nota TEXT NOT NULL UNIQUE,
         kasir TEXT NOT NULL,
         waktu TEXT NOT NULL,
-        nota TEXT NOT NULL
+        total INTEGER NOT NULL,
+        metode_bayar TEXT NOT NULL DEFAULT 'Kartu Debit/Kredit'
+    )
+    ''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_transaksi_waktu ON transaksi (waktu)")
+    
+    # Tabel item transaksi, nama disimpan sebagai cadangan bila produk dihapus.
+    # Aksi ON DELETE hanya berlaku di koneksi yang menyalakan PRAGMA foreign_keys,
+    # yaitu koneksi yang menulis transaksi atau menghapus produk/transaksi.
+    c.execute('''
+    CREATE TABLE IF NOT EXISTS transaksi_item (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        transaksi_id INTEGER NOT NULL REFERENCES transaksi (id) ON DELETE CASCADE,
+        produk_id INTEGER REFERENCES produk (id) ON DELETE SET NULL,
+        nama TEXT NOT NULL,
+        harga INTEGER NOT NULL,
+        qty INTEGER NOT NULL
     )
     ''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_transaksi_item_transaksi ON transaksi_item (transaksi_id)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_transaksi_item_produk ON transaksi_item (produk_id)")
     
     # Tabel nomor nota
     c.execute('''
@@ -82,8 +108,256 @@ def init_db():
     ''')
     
     conn.commit()
+    
+    # Nama produk unik; bila data lama masih punya nama kembar, pakai index biasa dulu
+    try:
+        c.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_produk_nama ON produk (nama)")
+    except sqlite3.IntegrityError:
+        c.execute("CREATE INDEX IF NOT EXISTS idx_produk_nama_kembar ON produk (nama)")
+    
+    migrasi_riwayat(conn)
     conn.close()
 
+def migrasi_riwayat(conn):
+    """Pindahkan tabel riwayat lama ke transaksi + transaksi_item.
+
+    Setelah migrasi, riwayat menjadi view dengan kolom yang sama seperti
+    tabel lama sehingga laporan dan arsip tetap bisa membacanya.
+    """
+    c = conn.cursor()
+
+    # Cek dulu tanpa kunci tulis; init_db dipanggil di setiap rerun halaman,
+    # jadi setelah migrasi selesai jalur ini tidak boleh menahan kasir lain
+    c.execute("SELECT type FROM sqlite_master WHERE name = 'riwayat'")
+    result = c.fetchone()
+    if result is not None and result[0] == "view":
+        return
+
+    c.execute("BEGIN IMMEDIATE")
+    try:
+        # Periksa ulang di dalam transaksi, proses lain mungkin sudah bermigrasi
+        c.execute("SELECT type FROM sqlite_master WHERE name = 'riwayat'")
+        result = c.fetchone()
+
+        if result is not None and result[0] == "table":
+            c.execute("""
+                INSERT INTO transaksi (nota, kasir, waktu, total)
+                SELECT nota, MIN(kasir), MIN(waktu), SUM(harga * qty)
+                FROM riwayat
+                GROUP BY nota
+                ORDER BY MIN(id)
+            """)
+            # id item dipertahankan agar tidak bentrok dengan id di file arsip
+            c.execute("""
+                INSERT INTO transaksi_item (id, transaksi_id, produk_id, nama, harga, qty)
+                SELECT r.id, t.id,
+                       (SELECT p.id FROM produk p WHERE p.nama = r.nama ORDER BY p.id LIMIT 1),
+                       r.nama, r.harga, r.qty
+                FROM riwayat r
+                JOIN transaksi t ON t.nota = r.nota
+                ORDER BY r.id
+            """)
+            c.execute("SELECT COALESCE(MAX(seq), 0) FROM sqlite_sequence WHERE name IN ('riwayat', 'transaksi_item')")
+            seq = c.fetchone()[0]
+            c.execute("DELETE FROM sqlite_sequence WHERE name IN ('riwayat', 'transaksi_item')")
+            c.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('transaksi_item', ?)", (seq,))
+            c.execute("DROP TABLE riwayat")
+
+        if result is None or result[0] == "table":
+            c.execute('''
+            CREATE VIEW riwayat AS
+            SELECT i.id,
+                   COALESCE(p.nama, i.nama) AS nama,
+                   i.harga,
+                   i.qty,
+                   t.kasir,
+                   t.waktu,
+                   t.nota,
+                   i.produk_id,
+                   t.metode_bayar
+            FROM transaksi_item i
+            JOIN transaksi t ON t.id = i.transaksi_id
+            LEFT JOIN produk p ON p.id = i.produk_id
+            ''')
+
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+# ---------- FUNGSI ARSIP RIWAYAT ----------
+def path_arsip(periode):
+    """Lokasi file arsip untuk periode 'YYYY-MM'"""
+    return os.path.join(ARSIP_DIR, f"riwayat_{periode.replace('-', '')}.db")
+
+def daftar_periode_arsip():
+    """Daftar periode ('YYYY-MM') yang sudah memiliki file arsip"""
+    if not os.path.isdir(ARSIP_DIR):
+        return []
+
+    periode = []
+    for nama_file in sorted(os.listdir(ARSIP_DIR)):
+        kode = nama_file[len("riwayat_"):-len(".db")]
+        if nama_file.startswith("riwayat_") and nama_file.endswith(".db") and len(kode) == 6 and kode.isdigit():
+            periode.append(f"{kode[:4]}-{kode[4:]}")
+    return periode
+
+def periode_berikutnya(periode):
+    """'2025-12' -> '2026-01'"""
+    tahun, bulan = int(periode[:4]), int(periode[5:7])
+    if bulan == 12:
+        return f"{tahun + 1}-01"
+    return f"{tahun}-{bulan + 1:02d}"
+
+def arsipkan_riwayat(db_path='kasir.db', ukuran_batch=500, jeda=0.05):
+    """Pindahkan riwayat bulan yang sudah tutup ke file arsip per periode.
+
+    Data dipindah per batch kecil dengan transaksi singkat supaya kasir
+    yang sedang checkout tidak ikut tertahan.
+    """
+    bulan_ini = get_indonesia_time().strftime("%Y-%m")
+
+    conn = sqlite3.connect(db_path, timeout=30)
+    conn.execute("PRAGMA foreign_keys = ON")
+    try:
+        c = conn.cursor()
+        c.execute("SELECT DISTINCT substr(waktu, 1, 7) FROM transaksi WHERE waktu < ? ORDER BY 1", (bulan_ini,))
+        periode_tutup = [row[0] for row in c.fetchall()]
+
+        jumlah_pindah = 0
+        for periode in periode_tutup:
+            os.makedirs(ARSIP_DIR, exist_ok=True)
+            c.execute("ATTACH DATABASE ? AS arsip", (path_arsip(periode),))
+            try:
+                c.execute('''
+                CREATE TABLE IF NOT EXISTS arsip.riwayat (
+                    id INTEGER PRIMARY KEY,
+                    nama TEXT NOT NULL,
+                    harga INTEGER NOT NULL,
+                    qty INTEGER NOT NULL,
+                    kasir TEXT NOT NULL,
+                    waktu TEXT NOT NULL,
+                    nota TEXT NOT NULL,
+                    produk_id INTEGER,
+                    metode_bayar TEXT
+                )
+                ''')
+                c.execute("CREATE INDEX IF NOT EXISTS arsip.idx_riwayat_waktu ON riwayat (waktu)")
+
+                # Arsip lama belum punya kolom produk_id dan metode_bayar
+                kolom_arsip = {row[1] for row in c.execute("PRAGMA arsip.table_info(riwayat)").fetchall()}
+                for kolom, tipe in (("produk_id", "INTEGER"), ("metode_bayar", "TEXT")):
+                    if kolom not in kolom_arsip:
+                        c.execute(f"ALTER TABLE arsip.riwayat ADD COLUMN {kolom} {tipe}")
+
+                while True:
+                    c.execute("""
+                        SELECT id FROM main.transaksi
+                        WHERE waktu >= ? AND waktu < ?
+                        ORDER BY id LIMIT ?
+                    """, (periode, periode_berikutnya(periode), ukuran_batch))
+                    ids = [row[0] for row in c.fetchall()]
+                    if not ids:
+                        break
+
+                    # Salin dan commit ke arsip dulu, baru hapus dari database aktif.
+                    # Pada mode WAL commit lintas file tidak atomik, jadi urutan ini
+                    # memastikan data tidak hilang; INSERT OR IGNORE membuatnya aman diulang.
+                    tanda = ",".join("?" * len(ids))
+                    c.execute(f"""
+                        INSERT OR IGNORE INTO arsip.riwayat
+                            (id, nama, harga, qty, kasir, waktu, nota, produk_id, metode_bayar)
+                        SELECT id, nama, harga, qty, kasir, waktu, nota, produk_id, metode_bayar
+                        FROM main.riwayat
+                        WHERE nota IN (SELECT nota FROM main.transaksi WHERE id IN ({tanda}))
+                    """, ids)
+                    conn.commit()
+                    # transaksi_item ikut terhapus lewat ON DELETE CASCADE
+                    c.execute(f"DELETE FROM main.transaksi WHERE id IN ({tanda})", ids)
+                    conn.commit()
+                    jumlah_pindah += len(ids)
+                    time.sleep(jeda)
+            finally:
+                conn.rollback()
+                c.execute("DETACH DATABASE arsip")
+
+            # File arsip tidak dipakai kasir, jadi aman di-VACUUM penuh. Bila
+            # sedang dibaca laporan, VACUUM ditunda ke jadwal berikutnya.
+            arsip_conn = sqlite3.connect(path_arsip(periode))
+            try:
+                arsip_conn.execute("VACUUM")
+            except sqlite3.OperationalError:
+                pass
+            finally:
+                arsip_conn.close()
+    finally:
+        conn.close()
+    return jumlah_pindah
+
+def baca_riwayat(conn, periode_awal=None, periode_akhir=None):
+    """Ambil riwayat dari tabel aktif lalu gabungkan arsip yang masuk rentang periode"""
+    riwayat_df = pd.read_sql_query("SELECT * FROM riwayat", conn)
+
+    bagian = [riwayat_df]
+    for periode in daftar_periode_arsip():
+        if periode_awal is not None and periode < periode_awal:
+            continue
+        if periode_akhir is not None and periode > periode_akhir:
+            continue
+        arsip_conn = sqlite3.connect(f"file:{path_arsip(periode)}?mode=ro", uri=True)
+        try:
+            bagian.append(pd.read_sql_query("SELECT * FROM riwayat", arsip_conn))
+        finally:
+            arsip_conn.close()
+
+    bagian = [df for df in bagian if not df.empty]
+    if not bagian:
+        return riwayat_df
+    return pd.concat(bagian, ignore_index=True).sort_values("waktu", ascending=False, ignore_index=True)
+
+def kompaksi_db(db_path='kasir.db', halaman_per_langkah=256, jeda=0.05):
+    """Kembalikan halaman kosong ke disk sedikit demi sedikit.
+
+    Hanya berjalan bila database sudah memakai auto_vacuum=INCREMENTAL.
+    Konversinya butuh VACUUM penuh yang menahan kasir, jadi dilakukan
+    terpisah di luar jam buka: python backup.py aktifkan-auto-vacuum.
+    Sebelum itu, langkah ini dilewati dan mengembalikan False.
+    """
+    conn = sqlite3.connect(db_path, timeout=30)
+    try:
+        if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+            return False
+
+        while conn.execute("PRAGMA freelist_count").fetchone()[0] > 0:
+            conn.execute(f"PRAGMA incremental_vacuum({int(halaman_per_langkah)})").fetchall()
+            time.sleep(jeda)
+        return True
+    finally:
+        conn.close()
+
+def jalankan_pemeliharaan(db_path='kasir.db'):
+    """Arsipkan bulan yang sudah tutup lalu kompaksi database aktif"""
+    jumlah = arsipkan_riwayat(db_path)
+    kompaksi_db(db_path)
+    return jumlah
+
+@st.cache_resource
+def mulai_pemeliharaan_terjadwal(interval_detik=6 * 60 * 60):
+    """Jalankan pemeliharaan di thread latar, sekali per proses server"""
+    def loop():
+        while True:
+            try:
+                jalankan_pemeliharaan()
+            except Exception:
+                # Database sibuk atau folder arsip bermasalah; catat lalu coba
+                # lagi di jadwal berikutnya agar thread ini tidak ikut mati
+                traceback.print_exc()
+            time.sleep(interval_detik)
+
+    thread = threading.Thread(target=loop, name="pemeliharaan-kasir", daemon=True)
+    thread.start()
+    return thread
+
 # ---------- FUNGSI PENGELOLAAN USER ----------
 def load_users():
     conn = sqlite3.connect('kasir.db')
@@ -147,8 +421,11 @@ def login():
         st.rerun()
 
 # ---------- FUNGSI HALAMAN KASIR ----------
-def get_nomor_nota():
-    conn = sqlite3.connect('kasir.db')
+def get_nomor_nota(conn=None):
+    """Ambil nomor nota berikutnya; bila conn diberikan, ikut transaksi pemanggil"""
+    koneksi_sendiri = conn is None
+    if koneksi_sendiri:
+        conn = sqlite3.connect('kasir.db')
     c = conn.cursor()
     # Menggunakan waktu Indonesia
     today = get_indonesia_time().strftime("%d%m%y")
@@ -163,11 +440,164 @@ def get_nomor_nota():
         nomor = result[0] + 1
         c.execute("UPDATE nomor_nota SET nomor = ? WHERE tanggal = ?", (nomor, today))
     
-    conn.commit()
-    conn.close()
+    if koneksi_sendiri:
+        conn.commit()
+        conn.close()
     
     return f"CS/{today}/{str(nomor).zfill(4)}"
 
+def simpan_transaksi(conn, nota, kasir, waktu, keranjang, metode_bayar="Kartu Debit/Kredit"):
+    """Simpan header nota dan item keranjang (produk_id, nama, harga, qty).
+
+    Tidak melakukan commit; pemanggil menentukan batas transaksinya.
+    """
+    c = conn.cursor()
+    total = sum(harga * qty for _, _, harga, qty in keranjang)
+    c.execute("""
+        INSERT INTO transaksi (nota, kasir, waktu, total, metode_bayar)
+        VALUES (?, ?, ?, ?, ?)
+    """, (nota, kasir, waktu, total, metode_bayar))
+    transaksi_id = c.lastrowid
+
+    c.executemany("""
+        INSERT INTO transaksi_item (transaksi_id, produk_id, nama, harga, qty)
+        VALUES (?, ?, ?, ?, ?)
+    """, [(transaksi_id, produk_id, nama, harga, qty) for produk_id, nama, harga, qty in keranjang])
+    return transaksi_id
+
+class StokTidakCukup(Exception):
+    """Stok produk di database lebih kecil dari qty di keranjang"""
+
+def proses_checkout(conn, keranjang, kasir, metode_bayar="Kartu Debit/Kredit", nomor_nota=None):
+    """Kurangi stok, ambil nomor nota dan simpan transaksi untuk satu keranjang.
+
+    Dipakai halaman kasir dan api.py. nomor_nota diisi bila nota sudah
+    dialokasikan lebih dulu; validasinya tanggung jawab pemanggil. Tidak
+    melakukan commit; bila stok kurang, StokTidakCukup dilempar dan
+    pemanggil wajib rollback.
+    """
+    c = conn.cursor()
+    for produk_id, nama, harga, qty in keranjang:
+        c.execute("UPDATE produk SET stok = stok - ? WHERE id = ? AND stok >= ?", (qty, produk_id, qty))
+        if c.rowcount == 0:
+            raise StokTidakCukup(nama)
+
+    # Menggunakan waktu Indonesia
+    now = get_indonesia_time()
+    if nomor_nota is None:
+        nomor_nota = get_nomor_nota(conn)
+    simpan_transaksi(conn, nomor_nota, kasir, now.isoformat(), keranjang, metode_bayar)
+    return nomor_nota, now
+
+def buat_struk(nomor_nota, now, keranjang, metode_bayar="Kartu Debit/Kredit"):
+    """Susun baris struk dari keranjang (produk_id, nama, harga, qty)"""
+    waktu_str = now.strftime("%d %b %y %H:%M")
+    total = sum(harga * qty for _, _, harga, qty in keranjang)
+
+    struk_lines = []
+    struk_lines.append("         Kasir Hijau")
+    struk_lines.append("=" * 30)
+    struk_lines.append(f"No Nota : {nomor_nota}")
+    struk_lines.append(f"Waktu   : {waktu_str}")
+    struk_lines.append("-" * 30)
+
+    for _, nama, harga, qty in keranjang:
+        total_item = harga * qty
+        harga_formatted = f"Rp{total_item:,}".replace(",", ".")
+        struk_lines.append(f"{qty} {nama:<18} {harga_formatted:>10}")
+
+    struk_lines.append("-" * 30)
+    subtotal_formatted = f"Rp{total:,}".replace(",", ".")
+    struk_lines.append(f"Subtotal {len(keranjang)} Produk  {subtotal_formatted:>10}")
+    total_formatted = f"Rp{total:,}".replace(",", ".")
+    struk_lines.append(f"Total Tagihan        {total_formatted:>10}")
+    struk_lines.append("")
+    struk_lines.append(metode_bayar)
+    bayar_formatted = f"Rp{total:,}".replace(",", ".")
+    struk_lines.append(f"Total Bayar          {bayar_formatted:>10}")
+    struk_lines.append("=" * 30)
+    struk_lines.append(f"Terbayar {waktu_str}")
+    struk_lines.append("Dicetak: Kasir")
+    return struk_lines
+
+def ubah_stok_massal(conn, perubahan):
+    """Set stok banyak produk sekaligus dari daftar (produk_id, stok).
+
+    Satu executemany dalam transaksi pemanggil; mengembalikan id yang tidak ditemukan.
+    """
+    ada = {row[0] for row in conn.execute("SELECT id FROM produk").fetchall()}
+    conn.executemany("UPDATE produk SET stok = ? WHERE id = ?",
+                     [(stok, produk_id) for produk_id, stok in perubahan if produk_id in ada])
+    return [produk_id for produk_id, _ in perubahan if produk_id not in ada]
+
+def ringkasan_penjualan(conn, dari=None, sampai=None, per_produk=True):
+    """Total penjualan, item dan nota antara tanggal 'YYYY-MM-DD' (inklusif).
+
+    Data aktif dihitung langsung dari transaksi (indeks waktu), arsip yang
+    masuk rentang dihitung per file lalu dijumlahkan. dari/sampai None
+    berarti tanpa batas.
+    """
+    batas_awal = dari or ""
+    if sampai is None:
+        batas_akhir = "9999"
+    else:
+        batas_akhir = (datetime.strptime(sampai, "%Y-%m-%d") + timedelta(days=1)).strftime("%Y-%m-%d")
+
+    hasil = {"total_penjualan": 0, "jumlah_item": 0, "jumlah_nota": 0}
+    daftar_produk = {}
+
+    def tambahkan(koneksi, query_total, query_produk):
+        total, item, nota = koneksi.execute(query_total, (batas_awal, batas_akhir)).fetchone()
+        hasil["total_penjualan"] += total or 0
+        hasil["jumlah_item"] += item or 0
+        hasil["jumlah_nota"] += nota or 0
+        if not per_produk:
+            return
+        for produk_id, nama, qty, subtotal in koneksi.execute(query_produk, (batas_awal, batas_akhir)).fetchall():
+            kunci = produk_id if produk_id is not None else nama
+            baris = daftar_produk.setdefault(kunci, {"produk_id": produk_id, "nama": nama, "qty": 0, "total": 0})
+            baris["qty"] += qty
+            baris["total"] += subtotal
+
+    tambahkan(conn, """
+        SELECT SUM(t.total),
+               (SELECT SUM(i.qty) FROM transaksi_item i JOIN transaksi t2 ON t2.id = i.transaksi_id
+                WHERE t2.waktu >= ?1 AND t2.waktu < ?2),
+               COUNT(*)
+        FROM transaksi t
+        WHERE t.waktu >= ?1 AND t.waktu < ?2
+    """, """
+        SELECT produk_id, nama, SUM(qty), SUM(harga * qty)
+        FROM riwayat
+        WHERE waktu >= ? AND waktu < ?
+        GROUP BY COALESCE(produk_id, nama)
+    """)
+
+    for periode in daftar_periode_arsip():
+        if (dari is not None and periode < dari[:7]) or (sampai is not None and periode > sampai[:7]):
+            continue
+        arsip_conn = sqlite3.connect(f"file:{path_arsip(periode)}?mode=ro", uri=True)
+        try:
+            # Arsip yang dibuat sebelum ada produk_id belum memiliki kolom tersebut
+            kolom_arsip = {row[1] for row in arsip_conn.execute("PRAGMA table_info(riwayat)").fetchall()}
+            kolom_produk = "produk_id" if "produk_id" in kolom_arsip else "NULL"
+            tambahkan(arsip_conn, """
+                SELECT SUM(harga * qty), SUM(qty), COUNT(DISTINCT nota)
+                FROM riwayat
+                WHERE waktu >= ? AND waktu < ?
+            """, f"""
+                SELECT {kolom_produk}, nama, SUM(qty), SUM(harga * qty)
+                FROM riwayat
+                WHERE waktu >= ? AND waktu < ?
+                GROUP BY COALESCE({kolom_produk}, nama)
+            """)
+        finally:
+            arsip_conn.close()
+
+    if per_produk:
+        hasil["per_produk"] = sorted(daftar_produk.values(), key=lambda baris: baris["total"], reverse=True)
+    return hasil
+
 # ---------- FUNGSI KASIR ----------
 def halaman_kasir():
     st.subheader("🛒 Kasir")
@@ -201,7 +631,7 @@ def halaman_kasir():
             with col3:
                 if st.button("Tambah", key=f"btn_{i}"):
                     if jumlah > 0:
-                        st.session_state.keranjang.append((row["nama"], row["harga"], jumlah))
+                        st.session_state.keranjang.append((int(row["id"]), row["nama"], int(row["harga"]), jumlah))
                         st.success(f"{row['nama']} ditambahkan!")
                         st.rerun()
     else:
@@ -210,7 +640,7 @@ def halaman_kasir():
     if st.session_state.keranjang:
         st.write("### Keranjang Belanja")
         total = 0
-        for i, (nama, harga, qty) in enumerate(st.session_state.keranjang):
+        for i, (_, nama, harga, qty) in enumerate(st.session_state.keranjang):
             col1, col2 = st.columns([4, 1])
             with col1:
                 st.write(f"{nama} x {qty} = {format_harga(harga * qty)}")
@@ -221,62 +651,32 @@ def halaman_kasir():
             total += harga * qty
         st.write(f"### Total: {format_harga(total)}")
 
+        st.selectbox("Metode Pembayaran", METODE_BAYAR, index=METODE_BAYAR.index("Kartu Debit/Kredit"), key="metode_bayar")
+
         if st.button("🗑️ Kosongkan Keranjang"):
             st.session_state.keranjang = []
             st.rerun()
 
     if st.button("🧾 Cetak Struk") and st.session_state.keranjang:
         conn = sqlite3.connect('kasir.db')
-        c = conn.cursor()
-        stok_kurang = False
-
-        # Periksa stok dalam transaksi
-        for nama, harga, qty in st.session_state.keranjang:
-            c.execute("SELECT stok FROM produk WHERE nama = ?", (nama,))
-            result = c.fetchone()
-            if result and result[0] >= qty:
-                c.execute("UPDATE produk SET stok = stok - ? WHERE nama = ?", (qty, nama))
-            else:
-                st.error(f"Stok {nama} tidak cukup!")
-                stok_kurang = True
-                break
+        conn.execute("PRAGMA foreign_keys = ON")
+        metode_bayar = st.session_state.get("metode_bayar", "Kartu Debit/Kredit")
 
-        if not stok_kurang:
+        # Stok, nomor nota dan riwayat disimpan dalam satu transaksi
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            nomor_nota, now = proses_checkout(conn, st.session_state.keranjang,
+                                              st.session_state.username, metode_bayar)
             conn.commit()
-
-            # Menggunakan waktu Indonesia
-            now = get_indonesia_time()
-            waktu_str = now.strftime("%d %b %y %H:%M")
-            waktu_iso = now.isoformat()
-            nomor_nota = get_nomor_nota()
-
-            total = sum(harga * qty for _, harga, qty in st.session_state.keranjang)
-
-            # struk
-            struk_lines = []
-            struk_lines.append("         Kasir Hijau")
-            struk_lines.append("=" * 30)
-            struk_lines.append(f"No Nota : {nomor_nota}")
-            struk_lines.append(f"Waktu   : {waktu_str}")
-            struk_lines.append("-" * 30)
-
-            for nama, harga, qty in st.session_state.keranjang:
-                total_item = harga * qty
-                harga_formatted = f"Rp{total_item:,}".replace(",", ".")
-                struk_lines.append(f"{qty} {nama:<18} {harga_formatted:>10}")
-
-            struk_lines.append("-" * 30)
-            subtotal_formatted = f"Rp{total:,}".replace(",", ".")
-            struk_lines.append(f"Subtotal {len(st.session_state.keranjang)} Produk  {subtotal_formatted:>10}")
-            total_formatted = f"Rp{total:,}".replace(",", ".")
-            struk_lines.append(f"Total Tagihan        {total_formatted:>10}")
-            struk_lines.append("")
-            struk_lines.append("Kartu Debit/Kredit")
-            bayar_formatted = f"Rp{total:,}".replace(",", ".")
-            struk_lines.append(f"Total Bayar          {bayar_formatted:>10}")
-            struk_lines.append("=" * 30)
-            struk_lines.append(f"Terbayar {waktu_str}")
-            struk_lines.append("Dicetak: Kasir")
+        except StokTidakCukup as e:
+            conn.rollback()
+            st.error(f"Stok {e} tidak cukup!")
+        except sqlite3.Error:
+            # Misalnya database terkunci terlalu lama oleh arsip atau API
+            conn.rollback()
+            st.error("Database sedang sibuk, transaksi belum tersimpan. Silakan coba lagi.")
+        else:
+            struk_lines = buat_struk(nomor_nota, now, st.session_state.keranjang, metode_bayar)
 
             struk = "\n".join(struk_lines)
             st.text_area("🧾 Struk Transaksi", struk, height=300)
@@ -297,24 +697,17 @@ def halaman_kasir():
             except Exception as e:
                 st.warning("Gagal membuat PDF. Silakan gunakan versi TXT.")
 
-            # SIMPAN RIWAYAT
-            for nama, harga, qty in st.session_state.keranjang:
-                c.execute("""
-                    INSERT INTO riwayat (nama, harga, qty, kasir, waktu, nota)
-                    VALUES (?, ?, ?, ?, ?, ?)
-                """, (nama, harga, qty, st.session_state.username, waktu_iso, nomor_nota))
-            
-            conn.commit()
             st.success("Pembelian berhasil!")
             st.session_state.keranjang = []
-        
-        conn.close()
+        finally:
+            conn.close()
 
 # ----------- RESET DATA PRODUK -------------
 def reset_data():
     if st.sidebar.button("🧹 Reset Data Produk"):
         if st.sidebar.button("⚠️ Konfirmasi Reset", type="secondary"):
             conn = sqlite3.connect('kasir.db')
+            conn.execute("PRAGMA foreign_keys = ON")
             c = conn.cursor()
             c.execute("DELETE FROM produk")
             conn.commit()
@@ -361,83 +754,214 @@ def halaman_tambah_produk():
             conn.commit()
             st.success("Produk berhasil ditambahkan!")
         except sqlite3.IntegrityError:
-            st.error("Gagal menambahkan produk. Periksa kembali data yang dimasukkan.")
+            st.error("Gagal menambahkan produk. Nama produk mungkin sudah terdaftar.")
         finally:
             conn.close()
     
-# ---------- FUNGSI HAPUS PRODUK SATUAN ----------
+# ---------- FUNGSI PERUBAHAN PRODUK MASSAL ----------
+class PerubahanBentrok(Exception):
+    """Produk sudah diubah proses lain sejak tabel edit dimuat"""
+
+def hitung_perubahan_produk(asli, baru):
+    """Bandingkan tabel produk saat dimuat dengan hasil edit (index = id), per sel.
+
+    Mengembalikan {kolom: [(nilai_baru, id, nilai_lama), ...]} hanya untuk sel
+    yang berubah; ValueError bila ada sel yang kosong atau tidak valid.
+    """
+    kolom = ["nama", "harga", "stok"]
+    baru = baru.loc[asli.index, kolom]
+
+    perubahan = {k: [] for k in kolom}
+    for produk_id in asli.index:
+        for k in kolom:
+            lama, nilai = asli.at[produk_id, k], baru.at[produk_id, k]
+            if pd.notna(nilai) and nilai == lama:
+                continue
+
+            if k == "nama":
+                nilai = str(nilai).strip() if pd.notna(nilai) else ""
+                if not nilai:
+                    raise ValueError(f"Nama produk id {produk_id} tidak boleh kosong.")
+                if nilai == lama:
+                    continue
+            else:
+                if pd.isna(nilai) or nilai < 0:
+                    raise ValueError(f"{k.capitalize()} '{asli.at[produk_id, 'nama']}' harus angka 0 atau lebih.")
+                nilai, lama = int(nilai), int(lama)
+            perubahan[k].append((nilai, int(produk_id), lama))
+
+    nama_akhir = baru["nama"].astype(str).str.strip()
+    duplikat = nama_akhir[nama_akhir.duplicated()].tolist()
+    if duplikat:
+        raise ValueError(f"Nama produk harus unik: {', '.join(sorted(set(duplikat)))}")
+    return {k: daftar for k, daftar in perubahan.items() if daftar}
+
+def simpan_perubahan_produk(perubahan, db_path='kasir.db'):
+    """Terapkan perubahan dari hitung_perubahan_produk dalam satu transaksi.
+
+    Hanya kolom yang berubah yang di-SET, satu executemany per kolom, dan
+    setiap baris dijaga dengan nilai saat dimuat (WHERE kolom = nilai_lama).
+    Bila ada yang tidak cocok, misalnya stok sudah berkurang karena checkout,
+    semua dibatalkan dan PerubahanBentrok dilempar berisi id produknya.
+    """
+    conn = sqlite3.connect(db_path)
+    c = conn.cursor()
+    try:
+        c.execute("BEGIN IMMEDIATE")
+
+        # Cek semua baris sekaligus agar pesan bentrok bisa menyebut produknya
+        ids = sorted({produk_id for daftar in perubahan.values() for _, produk_id, _ in daftar})
+        c.execute(f"SELECT id, nama, harga, stok FROM produk WHERE id IN ({','.join('?' * len(ids))})", ids)
+        sekarang = {row[0]: {"nama": row[1], "harga": row[2], "stok": row[3]} for row in c.fetchall()}
+        bentrok = {
+            produk_id
+            for kolom, daftar in perubahan.items()
+            for _, produk_id, lama in daftar
+            if produk_id not in sekarang or sekarang[produk_id][kolom] != lama
+        }
+        if bentrok:
+            raise PerubahanBentrok(sorted(bentrok))
+
+        for kolom, daftar in perubahan.items():
+            if kolom == "nama":
+                # Nama sementara dulu supaya pertukaran nama antar produk
+                # tidak melanggar index unik di tengah executemany
+                c.executemany("UPDATE produk SET nama = '__ubah__' || id WHERE id = ? AND nama = ?",
+                              [(produk_id, lama) for _, produk_id, lama in daftar])
+                diubah = c.rowcount
+                c.executemany("UPDATE produk SET nama = ? WHERE id = ?",
+                              [(nilai, produk_id) for nilai, produk_id, _ in daftar])
+            else:
+                c.executemany(f"UPDATE produk SET {kolom} = ? WHERE id = ? AND {kolom} = ?", daftar)
+                diubah = c.rowcount
+            if diubah != len(daftar):
+                raise PerubahanBentrok([produk_id for _, produk_id, _ in daftar])
+
+        conn.commit()
+    except (sqlite3.Error, PerubahanBentrok):
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+def hapus_produk_massal(produk_ids, db_path='kasir.db'):
+    """Hapus banyak produk berdasarkan id dalam satu transaksi"""
+    conn = sqlite3.connect(db_path)
+    conn.execute("PRAGMA foreign_keys = ON")
+    try:
+        conn.executemany("DELETE FROM produk WHERE id = ?", [(produk_id,) for produk_id in produk_ids])
+        conn.commit()
+    finally:
+        conn.close()
+
+# ---------- FUNGSI HAPUS PRODUK ----------
 def hapus_produk():
     st.subheader("🗑 Hapus Produk")
 
     conn = sqlite3.connect('kasir.db')
-    df = pd.read_sql_query("SELECT * FROM produk", conn)
+    df = pd.read_sql_query("SELECT id, nama FROM produk ORDER BY nama", conn)
     conn.close()
     
     if df.empty:
         st.info("Tidak ada produk yang tersedia.")
         return
     
-    produk_list = df["nama"].tolist()
-    produk_dipilih = st.selectbox("Pilih produk yang ingin dihapus:", produk_list)
+    nama_produk = dict(zip(df["id"], df["nama"]))
 
-    if produk_dipilih and st.button("Hapus Produk"):
-        if st.button("⚠️ Konfirmasi Hapus", type="secondary"):
-            conn = sqlite3.connect('kasir.db')
-            c = conn.cursor()
-            c.execute("DELETE FROM produk WHERE nama = ?", (produk_dipilih,))
-            conn.commit()
-            conn.close()
-            st.success(f"Produk '{produk_dipilih}' berhasil dihapus.")
-            st.rerun()
+    with st.form("form_hapus_produk"):
+        produk_dipilih = st.multiselect("Pilih produk yang ingin dihapus:", list(nama_produk),
+                                        format_func=lambda produk_id: nama_produk[produk_id])
+        konfirmasi = st.checkbox("⚠️ Saya yakin ingin menghapus produk yang dipilih")
+        hapus = st.form_submit_button("Hapus Produk")
+
+    if hapus and produk_dipilih:
+        if not konfirmasi:
+            st.error("Centang konfirmasi terlebih dahulu.")
+            return
+        hapus_produk_massal(produk_dipilih)
+        st.success(f"{len(produk_dipilih)} produk berhasil dihapus.")
+        st.rerun()
 
 # ---------- EDIT PRODUK -----------
 def edit_produk():
     st.subheader("✏ Edit Produk")
 
-    conn = sqlite3.connect('kasir.db')
-    df = pd.read_sql_query("SELECT * FROM produk", conn)
-    conn.close()
+    # Data saat tabel dimuat disimpan di session agar perubahan bisa dicek
+    # terhadap nilai awalnya, bukan terhadap data terbaru di database
+    muat_ulang = st.button("🔄 Muat Ulang Data")
+    if muat_ulang or "produk_asli" not in st.session_state:
+        conn = sqlite3.connect('kasir.db')
+        st.session_state.produk_asli = pd.read_sql_query(
+            "SELECT id, nama, harga, stok FROM produk ORDER BY id", conn, index_col="id")
+        conn.close()
+    df = st.session_state.produk_asli
     
     if df.empty:
         st.info("Tidak ada produk untuk diedit.")
         return
     
-    produk_list = df["nama"].tolist()
-    produk_dipilih = st.selectbox("Pilih produk yang ingin diedit:", produk_list)
-
-    if produk_dipilih:
-        produk_row = df[df["nama"] == produk_dipilih].iloc[0]
-
-        nama_baru = st.text_input("Nama Produk", value=produk_row["nama"])
-        harga_str_baru = st.text_input("Harga (misal: 5000)", value=str(int(produk_row['harga'])))
-        stok_baru = st.number_input("Stok", min_value=0, value=int(produk_row["stok"]))
-
-        if st.button("Simpan Perubahan"):
-            if not nama_baru or not harga_str_baru:
-                st.error("Nama produk dan harga harus diisi!")
-                return
+    st.caption("Ubah nama, harga atau stok langsung di tabel, lalu simpan sekali untuk semua perubahan.")
+
+    # Di dalam form, edit sel tidak memicu rerun; perubahan dikirim sekaligus saat disimpan
+    with st.form("form_edit_produk"):
+        hasil_edit = st.data_editor(
+            df,
+            use_container_width=True,
+            num_rows="fixed",
+            column_config={
+                "nama": st.column_config.TextColumn("Nama Produk", required=True),
+                "harga": st.column_config.NumberColumn("Harga", min_value=0, step=1, required=True),
+                "stok": st.column_config.NumberColumn("Stok", min_value=0, step=1, required=True),
+            },
+        )
+        simpan = st.form_submit_button("Simpan Perubahan")
+
+    if simpan:
+        try:
+            perubahan = hitung_perubahan_produk(df, hasil_edit)
+        except ValueError as e:
+            st.error(str(e))
+            return
 
-            try:
-                harga_baru = int(harga_str_baru.replace('.', '').replace(',', ''))
-            except ValueError:
-                st.error("Harga tidak valid. Harap isi angka seperti: 5000")
-                return
+        if not perubahan:
+            st.info("Tidak ada perubahan.")
+            return
 
-            # UPDATE DATA
-            conn = sqlite3.connect('kasir.db')
-            c = conn.cursor()
-            c.execute("""
-                UPDATE produk 
-                SET nama = ?, harga = ?, stok = ? 
-                WHERE nama = ?
-            """, (nama_baru, harga_baru, stok_baru, produk_dipilih))
-            conn.commit()
-            conn.close()
+        try:
+            simpan_perubahan_produk(perubahan)
+        except sqlite3.IntegrityError:
+            st.error("Gagal menyimpan. Nama produk sudah dipakai produk lain.")
+            return
+        except PerubahanBentrok as e:
+            nama_bentrok = ", ".join(str(df.at[produk_id, "nama"]) for produk_id in e.args[0])
+            st.error(f"Gagal menyimpan. Produk berikut sudah berubah sejak tabel dimuat: {nama_bentrok}. "
+                     "Klik Muat Ulang Data lalu ulangi perubahan.")
+            return
 
-            st.success(f"Produk '{produk_dipilih}' berhasil diperbarui!")
-            st.rerun()
+        jumlah_produk = len({produk_id for daftar in perubahan.values() for _, produk_id, _ in daftar})
+        del st.session_state.produk_asli
+        st.success(f"{jumlah_produk} produk berhasil diperbarui!")
+        st.rerun()
 
 # ---------- FUNGSI LAPORAN ----------
+def rentang_minggu(tahun, minggu):
+    """Rentang tanggal di tahun kalender `tahun` yang jatuh pada minggu ISO ke-`minggu`.
+
+    Bisa dua rentang, misalnya minggu ke-1 di awal Januari dan di akhir Desember.
+    """
+    awal_tahun, akhir_tahun = date(tahun, 1, 1), date(tahun, 12, 31)
+    rentang = []
+    for tahun_iso in (tahun - 1, tahun, tahun + 1):
+        try:
+            senin = date.fromisocalendar(tahun_iso, minggu, 1)
+        except ValueError:
+            continue
+        dari = max(senin, awal_tahun)
+        sampai = min(senin + timedelta(days=6), akhir_tahun)
+        if dari <= sampai:
+            rentang.append((dari.isoformat(), sampai.isoformat()))
+    return rentang
+
 # Ganti fungsi halaman_laporan() yang ada dengan yang ini:
 
 def halaman_laporan():
@@ -458,19 +982,48 @@ def halaman_laporan():
 
         st.subheader("🧾 Riwayat Transaksi")
 
-        # Cek apakah ada riwayat transaksi
-        c = conn.cursor()
-        c.execute("SELECT count(*) FROM riwayat")
-        count = c.fetchone()[0]
+        # PILIHAN FILTER
+        filter_jenis = st.radio("Filter berdasarkan:", ["Semua", "Harian", "Mingguan", "Bulanan"], horizontal=True)
+
+        # Rentang periode 'YYYY-MM' untuk menentukan arsip mana yang perlu dibuka
+        periode_awal = periode_akhir = None
+        # Rentang tanggal untuk ringkasan dari tabel transaksi
+        rentang_tanggal = [(None, None)]
+
+        if filter_jenis != "Semua":
+            now = get_indonesia_time()
+    
+            if filter_jenis == "Harian":
+                tanggal = st.date_input("Pilih Tanggal", now.date())
+                periode_awal = periode_akhir = tanggal.strftime("%Y-%m")
+                rentang_tanggal = [(tanggal.isoformat(), tanggal.isoformat())]
+
+            elif filter_jenis == "Mingguan":
+                tahun = st.number_input("Tahun", value=now.year, step=1, min_value=2020, max_value=2030)
+                minggu = st.selectbox("Pilih Minggu ke-", list(range(1, 54)), index=min(now.isocalendar()[1] - 1, 52))
+                periode_awal, periode_akhir = f"{int(tahun)}-01", f"{int(tahun)}-12"
+                rentang_tanggal = rentang_minggu(int(tahun), minggu)
+
+            elif filter_jenis == "Bulanan":
+                bulan = st.selectbox("Pilih Bulan", 
+                                    ["Januari", "Februari", "Maret", "April", "Mei", "Juni",
+                                    "Juli", "Agustus", "September", "Oktober", "November", "Desember"], 
+                                    index=now.month - 1)
+                bulan_angka = ["Januari", "Februari", "Maret", "April", "Mei", "Juni",
+                                "Juli", "Agustus", "September", "Oktober", "November", "Desember"].index(bulan) + 1
+                tahun = st.number_input("Tahun", value=now.year, step=1, min_value=2020, max_value=2030)
+                periode_awal = periode_akhir = f"{int(tahun)}-{bulan_angka:02d}"
+                akhir_bulan = datetime.strptime(periode_berikutnya(periode_awal), "%Y-%m").date() - timedelta(days=1)
+                rentang_tanggal = [(f"{periode_awal}-01", akhir_bulan.isoformat())]
+
+        # Ambil data riwayat (tabel aktif + arsip periode terkait)
+        riwayat_df = baca_riwayat(conn, periode_awal, periode_akhir)
         
-        if count == 0:
+        if riwayat_df.empty:
             st.info("Belum ada riwayat transaksi.")
             conn.close()
             return
         
-        # Ambil data riwayat
-        riwayat_df = pd.read_sql_query("SELECT * FROM riwayat ORDER BY waktu DESC", conn)
-        
         # Parse waktu dengan lebih robust
         def parse_waktu_safe(waktu_str):
             try:
@@ -512,48 +1065,30 @@ def halaman_laporan():
             conn.close()
             return
 
-        # PILIHAN FILTER
-        filter_jenis = st.radio("Filter berdasarkan:", ["Semua", "Harian", "Mingguan", "Bulanan"], horizontal=True)
-
         filtered = riwayat_df.copy()
 
-        if filter_jenis != "Semua":
-            now = get_indonesia_time()
-    
-            if filter_jenis == "Harian":
-                tanggal = st.date_input("Pilih Tanggal", now.date())
-                filtered = riwayat_df[riwayat_df["waktu_parsed"].dt.date == tanggal]
+        if filter_jenis == "Harian":
+            filtered = riwayat_df[riwayat_df["waktu_parsed"].dt.date == tanggal]
 
-            elif filter_jenis == "Mingguan":
-                tahun = st.number_input("Tahun", value=now.year, step=1, min_value=2020, max_value=2030)
-                minggu = st.selectbox("Pilih Minggu ke-", list(range(1, 54)), index=min(now.isocalendar()[1] - 1, 52))
-
-                try:
-                    filtered = riwayat_df[
-                        (riwayat_df["waktu_parsed"].dt.isocalendar().week == minggu) &
-                        (riwayat_df["waktu_parsed"].dt.year == tahun)
-                    ]
-                except Exception as e:
-                    st.error(f"Error filter mingguan: {e}")
-                    filtered = pd.DataFrame()
+        elif filter_jenis == "Mingguan":
+            try:
+                filtered = riwayat_df[
+                    (riwayat_df["waktu_parsed"].dt.isocalendar().week == minggu) &
+                    (riwayat_df["waktu_parsed"].dt.year == tahun)
+                ]
+            except Exception as e:
+                st.error(f"Error filter mingguan: {e}")
+                filtered = pd.DataFrame()
 
-            elif filter_jenis == "Bulanan":
-                bulan = st.selectbox("Pilih Bulan", 
-                                    ["Januari", "Februari", "Maret", "April", "Mei", "Juni",
-                                    "Juli", "Agustus", "September", "Oktober", "November", "Desember"], 
-                                    index=now.month - 1)
-                bulan_angka = ["Januari", "Februari", "Maret", "April", "Mei", "Juni",
-                                "Juli", "Agustus", "September", "Oktober", "November", "Desember"].index(bulan) + 1
-                tahun = st.number_input("Tahun", value=now.year, step=1, min_value=2020, max_value=2030)
-                    
-                try:
-                    filtered = riwayat_df[
-                        (riwayat_df["waktu_parsed"].dt.month == bulan_angka) &
-                        (riwayat_df["waktu_parsed"].dt.year == tahun)
-                    ]
-                except Exception as e:
-                    st.error(f"Error filter bulanan: {e}")
-                    filtered = pd.DataFrame()
+        elif filter_jenis == "Bulanan":
+            try:
+                filtered = riwayat_df[
+                    (riwayat_df["waktu_parsed"].dt.month == bulan_angka) &
+                    (riwayat_df["waktu_parsed"].dt.year == tahun)
+                ]
+            except Exception as e:
+                st.error(f"Error filter bulanan: {e}")
+                filtered = pd.DataFrame()
         
         if filtered.empty:
             st.warning("Tidak ada transaksi untuk periode yang dipilih.")
@@ -576,9 +1111,13 @@ def halaman_laporan():
 
             # Hitung statistik
             try:
-                total_transaksi = (filtered["harga"] * filtered["qty"]).sum()
-                jumlah_item = filtered["qty"].sum()
-                jumlah_nota = filtered["nota"].nunique()
+                # Dihitung dari tabel transaksi (indeks waktu), bukan dari baris item
+                total_transaksi = jumlah_item = jumlah_nota = 0
+                for dari, sampai in rentang_tanggal:
+                    ringkasan = ringkasan_penjualan(conn, dari, sampai, per_produk=False)
+                    total_transaksi += ringkasan["total_penjualan"]
+                    jumlah_item += ringkasan["jumlah_item"]
+                    jumlah_nota += ringkasan["jumlah_nota"]
 
                 # TAMPILAN RINGKASAN
                 st.markdown("### Ringkasan:")
@@ -707,6 +1246,7 @@ def main():
     )
     
     init_db()
+    mulai_pemeliharaan_terjadwal()
     
     if 'logged_in' not in st.session_state:
         st.session_state.logged_in = False 
@@ -738,6 +1278,8 @@ def main():
             for key, label in menu_options.items():
                 if st.button(label, use_container_width=True):
                     st.session_state.menu = key
+                    # Tabel edit produk dimuat ulang setiap kali halaman dibuka
+                    st.session_state.pop("produk_asli", None)
                     st.rerun()
             
             st.markdown("---")